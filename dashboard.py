@@ -4,18 +4,57 @@ Commercial Grade Web Dashboard for RTMP Streamer
 Flask-based control panel for Raspberry Pi camera streamer
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
+from flask_compress import Compress
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from werkzeug.security import generate_password_hash, check_password_hash
-import json
+import bisect
+import hmac
+import msgspec
+import re
+import orjson
 import subprocess
 import os
 import psutil
 from datetime import datetime, timedelta
+from typing import List, Optional
 import threading
 import time
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+
+# Persist the session-signing key so cookies survive restarts - a
+# fresh os.urandom key on every start logged out all browsers, each
+# of which then re-triggered the expensive PBKDF2 login
+SECRET_PATH = '/home/pi/streamer/.secret'
+
+def load_secret_key():
+    """Load (or create) the persistent session-signing key"""
+    try:
+        with open(SECRET_PATH, 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+    key = os.urandom(32)
+    try:
+        os.makedirs(os.path.dirname(SECRET_PATH), exist_ok=True)
+        with open(SECRET_PATH, 'wb') as f:
+            f.write(key)
+        os.chmod(SECRET_PATH, 0o600)
+    except OSError:
+        pass  # Fall back to a per-process key
+    return key
+
+app.secret_key = load_secret_key()
+app.config['SESSION_COOKIE_SAMESITE'] = 'Strict'
+Compress(app)  # Transparent gzip - the status JSON compresses ~3x
+limiter = Limiter(get_remote_address, app=app, storage_uri='memory://')
+
+def json_response(payload, status=200):
+    """Build a JSON response with orjson (~5x faster than stdlib)"""
+    return Response(orjson.dumps(payload), status=status,
+                    mimetype='application/json')
 
 # Default password: "admin" - CHANGE THIS!
 PASSWORD_HASH = "pbkdf2:sha256:600000$5qZ8vQKW$8e89c7d3e5f4a2b1c9d7e6f5a4b3c2d1e0f9a8b7c6d5e4f3a2b1c0d9e8f7a6b5"
@@ -24,48 +63,169 @@ CONFIG_FILE = '/home/pi/streamer/config.json'
 STATUS_FILE = '/home/pi/streamer/status.json'
 LOG_FILE = '/home/pi/streamer/logs/streamer.log'
 
+class Config(msgspec.Struct):
+    """Streaming configuration schema (mirrors streamer.py)"""
+    rtmp_url: str = "rtmp://a.rtmp.youtube.com/live2/"
+    stream_key: str = ""
+    resolution: List[int] = msgspec.field(default_factory=lambda: [1920, 1080])
+    framerate: int = 30
+    bitrate: int = 2500000
+    gop_size: int = 60
+    preset: str = "medium"
+    audio_enabled: bool = False
+    audio_source: str = "default"  # PulseAudio source name
+
+class Status(msgspec.Struct):
+    """Status file schema written by streamer.py"""
+    streaming: bool
+    start_time: Optional[str]
+    resolution: List[int]
+    framerate: int
+    bitrate: int
+
+BOOT_TIME = psutil.boot_time()  # Constant for the life of the host
+
+def fmt_uptime(secs):
+    """Format seconds as H:MM:SS without timedelta allocations"""
+    h, r = divmod(int(secs), 3600)
+    m, s = divmod(r, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
 # System stats cache
 stats_cache = {
     'data': {},
     'timestamp': 0
 }
 
+# Persistent fds for the /proc and /sys files sampled every poll -
+# each sample is one os.pread, with no open/close, path walk, or
+# file object per call
+_proc_fds = {}
+
+def read_proc(path, size=4096):
+    """Read a /proc or /sys file through a persistent fd"""
+    fd = _proc_fds.get(path)
+    if fd is None:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        _proc_fds[path] = fd
+    return os.pread(fd, size, 0)
+
+def read_net_bytes():
+    """Read total bytes sent/received from /proc/net/dev"""
+    sent = recv = 0
+    for line in read_proc('/proc/net/dev', 65536).decode().splitlines()[2:]:
+        iface, data = line.split(':', 1)
+        if iface.strip() == 'lo':
+            continue
+        fields = data.split()
+        recv += int(fields[0])
+        sent += int(fields[8])
+    return sent, recv
+
+def read_meminfo():
+    """Read total/available memory in bytes from /proc/meminfo"""
+    total = available = 0
+    for line in read_proc('/proc/meminfo').decode().splitlines():
+        if line.startswith('MemTotal:'):
+            total = int(line.split()[1]) * 1024
+        elif line.startswith('MemAvailable:'):
+            available = int(line.split()[1]) * 1024
+            break
+    return total, available
+
+# Latest CPU reading, published by the sampler thread. psutil keys
+# its cpu_percent delta state per thread ident, so request threads
+# (fresh per request/greenlet) can't compute the delta themselves -
+# they read this shared value instead
+cpu_percent_value = 0.0
+
+def cpu_sampler():
+    """Background CPU sampler so request threads never block"""
+    global cpu_percent_value
+    while True:
+        cpu_percent_value = psutil.cpu_percent(interval=2.0)
+
+threading.Thread(target=cpu_sampler, daemon=True).start()
+
+# Session tokens issued on login are self-authenticating -
+# "expiry:hmac(secret, expiry)" - so they need no server-side store
+# and, with the persisted secret key, stay valid across dashboard
+# restarts. Requests are validated against the signature instead of
+# re-running PBKDF2, so the only place the 600k-iteration hash runs
+# is the rate-limited login POST
+TOKEN_TTL = 12 * 3600
+
 def check_password(password):
     """Verify password against hash"""
     return check_password_hash(PASSWORD_HASH, password)
 
-def login_required(f):
-    """Decorator to require login"""
-    from functools import wraps
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get('logged_in'):
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+def sign_expiry(expiry):
+    """HMAC a token expiry timestamp with the app secret"""
+    return hmac.new(app.secret_key, expiry.encode(), 'sha256').hexdigest()
+
+def issue_token():
+    """Issue a signed session token after a successful login"""
+    expiry = str(int(time.time() + TOKEN_TTL))
+    return f"{expiry}:{sign_expiry(expiry)}"
+
+def check_token(token):
+    """Validate a session token in constant time"""
+    expiry, sep, sig = token.partition(':')
+    if not sep or not expiry.isdigit() or int(expiry) < time.time():
+        return False
+    return hmac.compare_digest(sig, sign_expiry(expiry))
+
+# Endpoints reachable without a session
+PUBLIC_ENDPOINTS = {'login', 'logout', 'static'}
+
+@app.before_request
+def require_login():
+    """Single auth check per request instead of per-route wrappers"""
+    if request.endpoint in PUBLIC_ENDPOINTS or request.endpoint is None:
+        return
+    if not session.get('logged_in') or not check_token(session.get('token', '')):
+        # Logged-out API polls get a 401 instead of a redirect -
+        # fetch() follows 302s, and a polling tab chasing redirects
+        # into /login would burn its own login rate limit
+        if request.path.startswith('/api/'):
+            return json_response({'error': 'Not logged in'}, 401)
+        return redirect(url_for('login'))
+
+# Service status cache (systemd cgroup read, no fork)
+SERVICE_CGROUP = '/sys/fs/cgroup/system.slice/rtmp-streamer.service/cgroup.procs'
+service_cache = {
+    'running': False,
+    'timestamp': 0
+}
 
 def get_service_status():
     """Check if streamer service is running"""
+    now = time.time()
+    if now - service_cache['timestamp'] < 2:  # Cache for 2 seconds
+        return service_cache['running']
+
+    # The service's cgroup lists its PIDs; a non-empty file means the
+    # unit is running. One open()/read() instead of forking systemctl
     try:
-        result = subprocess.run(
-            ['systemctl', 'is-active', 'rtmp-streamer'],
-            capture_output=True,
-            text=True
-        )
-        return result.stdout.strip() == 'active'
+        with open(SERVICE_CGROUP, 'r') as f:
+            running = bool(f.read().strip())
     except:
-        return False
+        running = False
+
+    service_cache['running'] = running
+    service_cache['timestamp'] = now
+    return running
 
 def get_stream_status():
     """Get current stream status from status file"""
     try:
         if os.path.exists(STATUS_FILE):
-            with open(STATUS_FILE, 'r') as f:
-                status = json.load(f)
+            with open(STATUS_FILE, 'rb') as f:
+                status = msgspec.to_builtins(
+                    msgspec.json.decode(f.read(), type=Status))
                 if status.get('streaming') and status.get('start_time'):
-                    start = datetime.fromisoformat(status['start_time'])
-                    uptime = datetime.now() - start
-                    status['uptime'] = str(uptime).split('.')[0]
+                    start = datetime.fromisoformat(status['start_time']).timestamp()
+                    status['uptime'] = fmt_uptime(time.time() - start)
                 return status
     except Exception as e:
         print(f"Error reading status: {e}")
@@ -81,33 +241,33 @@ def get_stream_status():
 def get_system_stats():
     """Get system statistics with caching"""
     now = time.time()
-    if now - stats_cache['timestamp'] < 2:  # Cache for 2 seconds
+    if now - stats_cache['timestamp'] < 5:  # Cache for 5 seconds
         return stats_cache['data']
-    
+
     try:
-        # CPU
-        cpu_percent = psutil.cpu_percent(interval=1)
+        # CPU (non-blocking: the sampler thread publishes the value)
+        cpu_percent = cpu_percent_value
         cpu_freq = psutil.cpu_freq()
         
-        # Memory
-        mem = psutil.virtual_memory()
-        
+        # Memory (single pread of /proc/meminfo)
+        mem_total, mem_available = read_meminfo()
+        mem_used = mem_total - mem_available
+        mem_percent = 100.0 * mem_used / mem_total if mem_total else 0
+
         # Disk
         disk = psutil.disk_usage('/')
         
         # Temperature
         try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp = float(f.read().strip()) / 1000.0
+            temp = float(read_proc('/sys/class/thermal/thermal_zone0/temp', 16).strip()) / 1000.0
         except:
             temp = 0
-        
+
         # Network
-        net = psutil.net_io_counters()
-        
-        # Uptime
-        boot_time = datetime.fromtimestamp(psutil.boot_time())
-        uptime = datetime.now() - boot_time
+        try:
+            net_sent, net_recv = read_net_bytes()
+        except:
+            net_sent = net_recv = 0
         
         stats = {
             'cpu': {
@@ -115,9 +275,9 @@ def get_system_stats():
                 'freq': round(cpu_freq.current, 0) if cpu_freq else 0
             },
             'memory': {
-                'percent': round(mem.percent, 1),
-                'used': round(mem.used / (1024**3), 2),
-                'total': round(mem.total / (1024**3), 2)
+                'percent': round(mem_percent, 1),
+                'used': round(mem_used / (1024**3), 2),
+                'total': round(mem_total / (1024**3), 2)
             },
             'disk': {
                 'percent': round(disk.percent, 1),
@@ -126,10 +286,10 @@ def get_system_stats():
             },
             'temperature': round(temp, 1),
             'network': {
-                'sent': round(net.bytes_sent / (1024**3), 2),
-                'recv': round(net.bytes_recv / (1024**3), 2)
+                'sent': round(net_sent / (1024**3), 2),
+                'recv': round(net_recv / (1024**3), 2)
             },
-            'uptime': str(uptime).split('.')[0]
+            'uptime': fmt_uptime(now - BOOT_TIME)
         }
         
         stats_cache['data'] = stats
@@ -141,45 +301,113 @@ def get_system_stats():
         print(f"Error getting stats: {e}")
         return {}
 
+# Precompiled matchers for /api/logs?level= filtering. Hyperscan
+# scans at multi-GB/s when installed; the compiled re alternation
+# fallback is ample for tail-sized buffers
+LOG_LEVEL_IDS = {'info': 1, 'warn': 2, 'error': 3}
+try:
+    import hyperscan
+    _hs_db = hyperscan.Database()
+    _hs_db.compile(expressions=[b'ERROR', b'WARN', b'INFO'],
+                   ids=[3, 2, 1],
+                   flags=[hyperscan.HS_FLAG_CASELESS] * 3)
+except ImportError:
+    _hs_db = None
+_level_re = re.compile(r'ERROR|WARN|INFO', re.IGNORECASE)
+
+def filter_logs(text, level):
+    """Keep only lines at or above the given log level"""
+    min_id = LOG_LEVEL_IDS.get(level.lower())
+    if not min_id:
+        return text
+
+    lines = text.splitlines()
+    # Untagged lines - the streamer's default "[timestamp] message"
+    # format - count as INFO, so ?level=info passes everything
+    best = [LOG_LEVEL_IDS['info']] * len(lines)
+
+    if _hs_db is not None:
+        # One scan over the whole buffer; matches are bucketed onto
+        # lines by byte offset
+        data = text.encode()
+        line_starts = [0]
+        idx = data.find(b'\n')
+        while idx != -1:
+            line_starts.append(idx + 1)
+            idx = data.find(b'\n', idx + 1)
+
+        def on_match(match_id, start, end, flags, ctx):
+            # Bucket by the match end - hyperscan only reports start
+            # offsets when SOM is requested, which costs extra state
+            i = bisect.bisect_right(line_starts, end - 1) - 1
+            if i < len(best) and match_id > best[i]:
+                best[i] = match_id
+
+        _hs_db.scan(data, match_event_handler=on_match)
+    else:
+        for i, line in enumerate(lines):
+            for m in _level_re.findall(line):
+                match_id = LOG_LEVEL_IDS[m.lower()]
+                if match_id > best[i]:
+                    best[i] = match_id
+
+    return '\n'.join(line for line, b in zip(lines, best) if b >= min_id)
+
+# Log tail cache - skip re-reading when the file hasn't changed
+logs_cache = {
+    'inode': None,
+    'size': None,
+    'lines': None,
+    'tail': ''
+}
+
 def get_stream_logs(lines=50):
     """Get last N lines from stream log"""
     try:
-        if os.path.exists(LOG_FILE):
-            result = subprocess.run(
-                ['tail', '-n', str(lines), LOG_FILE],
-                capture_output=True,
-                text=True
-            )
-            return result.stdout
+        st = os.stat(LOG_FILE)
+        if (st.st_ino == logs_cache['inode'] and
+                st.st_size == logs_cache['size'] and
+                lines == logs_cache['lines']):
+            return logs_cache['tail']
+
+        # Seek near EOF and read a bounded suffix instead of forking
+        # tail - log lines average ~200 bytes
+        with open(LOG_FILE, 'rb') as f:
+            f.seek(max(0, st.st_size - lines * 200))
+            tail = f.read()
+        text = '\n'.join(
+            tail.decode('utf-8', errors='replace').splitlines()[-lines:]
+        )
+
+        logs_cache['inode'] = st.st_ino
+        logs_cache['size'] = st.st_size
+        logs_cache['lines'] = lines
+        logs_cache['tail'] = text
+        return text
     except:
         pass
     return "No logs available"
 
 def load_config():
-    """Load streaming configuration"""
+    """Load and validate streaming configuration"""
     try:
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
+            with open(CONFIG_FILE, 'rb') as f:
+                return msgspec.to_builtins(
+                    msgspec.json.decode(f.read(), type=Config))
     except:
         pass
-    
-    return {
-        'rtmp_url': 'rtmp://a.rtmp.youtube.com/live2/',
-        'stream_key': '',
-        'resolution': [1920, 1080],
-        'framerate': 30,
-        'bitrate': 2500000,
-        'preset': 'medium',
-        'audio_enabled': False
-    }
+
+    return msgspec.to_builtins(Config())
 
 def save_config(config):
-    """Save streaming configuration"""
+    """Save streaming configuration (atomic write)"""
     try:
         os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
+        tmp = CONFIG_FILE + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(msgspec.json.format(msgspec.json.encode(config), indent=2))
+        os.replace(tmp, CONFIG_FILE)
         return True
     except Exception as e:
         print(f"Error saving config: {e}")
@@ -187,18 +415,19 @@ def save_config(config):
 
 # Routes
 @app.route('/')
-@login_required
 def index():
     """Main dashboard page"""
     return render_template('dashboard.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit("5/minute", methods=["POST"])
 def login():
     """Login page"""
     if request.method == 'POST':
         password = request.form.get('password')
         if check_password(password):
             session['logged_in'] = True
+            session['token'] = issue_token()
             return redirect(url_for('index'))
         return render_template('login.html', error='Invalid password')
     return render_template('login.html')
@@ -207,44 +436,91 @@ def login():
 def logout():
     """Logout"""
     session.pop('logged_in', None)
+    session.pop('token', None)
     return redirect(url_for('login'))
 
 # API Routes
 @app.route('/api/status')
-@login_required
 def api_status():
     """Get complete system and stream status"""
-    return jsonify({
+    return json_response({
         'service_running': get_service_status(),
         'stream_status': get_stream_status(),
         'system_stats': get_system_stats()
     })
 
 @app.route('/api/config', methods=['GET', 'POST'])
-@login_required
 def api_config():
     """Get or update configuration"""
     if request.method == 'POST':
         config = request.json
         # Don't allow stream_key to be empty
         if not config.get('stream_key'):
-            return jsonify({'success': False, 'error': 'Stream key required'}), 400
-        
+            return json_response({'success': False, 'error': 'Stream key required'}, 400)
+
+        # Schema-validate before anything is written; bad types that
+        # would crash the streamer become clean 400s here
+        try:
+            config = msgspec.convert(config, Config)
+        except msgspec.ValidationError as e:
+            return json_response({'success': False, 'error': f'Invalid config: {e}'}, 400)
+
         if save_config(config):
-            return jsonify({'success': True})
-        return jsonify({'success': False, 'error': 'Failed to save config'}), 500
-    
-    return jsonify(load_config())
+            return json_response({'success': True})
+        return json_response({'success': False, 'error': 'Failed to save config'}, 500)
+
+    return json_response(load_config())
 
 @app.route('/api/logs')
-@login_required
 def api_logs():
     """Get stream logs"""
+    # Incremental mode: ?since=<offset> returns only bytes appended
+    # after that offset, so steady-state polls cost ~0 bytes. The
+    # ETag is the file size; pollers sending If-None-Match get a 304
+    level = request.args.get('level')
+    since = request.args.get('since', type=int)
+    if since is not None:
+        try:
+            st = os.stat(LOG_FILE)
+        except OSError:
+            return json_response({'logs': '', 'offset': 0})
+
+        etag = str(st.st_size)
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+
+        since = max(0, since)  # Negative offsets would blow up seek()
+        if since > st.st_size:  # File was rotated/truncated
+            since = 0
+        if since == st.st_size:
+            new = ''
+            offset = st.st_size
+        else:
+            with open(LOG_FILE, 'rb') as f:
+                f.seek(since)
+                data = f.read(1024 * 1024)  # Cap one poll at 1 MB
+            new = data.decode('utf-8', errors='replace')
+            offset = since + len(data)
+
+        if level:
+            new = filter_logs(new, level)
+        resp = json_response({'logs': new, 'offset': offset})
+        resp.headers['ETag'] = etag
+        return resp
+
     lines = request.args.get('lines', 50, type=int)
-    return jsonify({'logs': get_stream_logs(lines)})
+    logs = get_stream_logs(lines)
+    if level:
+        logs = filter_logs(logs, level)
+    # Also hand back the current end-of-file offset so the client
+    # can switch to incremental (?since=) polling from here
+    try:
+        offset = os.stat(LOG_FILE).st_size
+    except OSError:
+        offset = 0
+    return json_response({'logs': logs, 'offset': offset})
 
 @app.route('/api/control/<action>', methods=['POST'])
-@login_required
 def api_control(action):
     """Control streamer service"""
     try:
@@ -274,6 +550,15 @@ def api_control(action):
 if __name__ == '__main__':
     # Create necessary directories
     os.makedirs('/home/pi/streamer/logs', exist_ok=True)
+
+    # Pin the dashboard to core 0 - the streamer runs on cores 2-3,
+    # so polling can't steal cycles from the encode path
+    try:
+        os.sched_setaffinity(0, {0})
+    except Exception as e:
+        print(f"Could not set CPU affinity: {e}")
     
-    # Run Flask app
+    # Run Flask dev server. The installed service runs under
+    # gunicorn with gevent workers instead, so concurrent dashboard
+    # polls don't serialize behind each other
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -73,7 +73,7 @@ install_python_packages() {
     print_header "Installing Python Packages"
     
     print_color $BLUE "Installing Flask and dependencies..."
-    pip3 install --user Flask werkzeug psutil
+    pip3 install --user Flask werkzeug psutil orjson msgspec flask-compress flask-limiter gunicorn gevent
     
     print_color $GREEN "✅ Python packages installed"
 }
@@ -288,6 +288,8 @@ Type=simple
 User=$USER
 WorkingDirectory=$INSTALL_DIR
 ExecStart=/usr/bin/python3 $INSTALL_DIR/streamer.py
+CPUAffinity=2 3
+Nice=-10
 Restart=always
 RestartSec=10
 StandardOutput=journal
@@ -307,7 +309,8 @@ After=network.target
 Type=simple
 User=$USER
 WorkingDirectory=$INSTALL_DIR
-ExecStart=/usr/bin/python3 $INSTALL_DIR/dashboard.py
+ExecStart=/home/$USER/.local/bin/gunicorn -k gevent -w 1 -b 0.0.0.0:5000 dashboard:app
+CPUAffinity=0
 Restart=always
 RestartSec=10
 StandardOutput=journal
@@ -7,25 +7,84 @@ Uses picamera2 for camera control and FFmpeg for encoding
 
 import subprocess
 import time
-import json
+import msgspec
 import os
 import sys
 from datetime import datetime
-from picamera2 import Picamera2
+from typing import List, Optional
+from picamera2 import Picamera2, MappedArray
 from picamera2.encoders import H264Encoder, Quality
 from picamera2.outputs import FfmpegOutput
 import signal
 
+# Numba is optional - only needed if a frame processor is installed
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def dim_top_strip(frame):
+        """Example frame processor: darken a strip of the luma plane
+        as a backdrop for overlay text. prange spreads the rows
+        across all four cores at line rate - a plain Python pixel
+        loop here would be 50-200x slower and drop frames."""
+        for y in prange(32):
+            for x in range(frame.shape[1]):
+                frame[y, x] = frame[y, x] // 2
+
+class Config(msgspec.Struct):
+    """Streaming configuration schema - defaults double as the
+    fallback config, and decoding rejects values that would hand
+    FFmpeg a broken command line"""
+    rtmp_url: str = "rtmp://a.rtmp.youtube.com/live2/"
+    stream_key: str = "YOUR_STREAM_KEY_HERE"
+    resolution: List[int] = msgspec.field(default_factory=lambda: [1920, 1080])
+    framerate: int = 30
+    bitrate: int = 2500000
+    gop_size: int = 60
+    preset: str = "medium"
+    audio_enabled: bool = False
+    audio_source: str = "default"  # PulseAudio source name
+
+class Status(msgspec.Struct):
+    """Status file schema consumed by the dashboard"""
+    streaming: bool
+    start_time: Optional[str]
+    resolution: List[int]
+    framerate: int
+    bitrate: int
+
 class RTMPStreamer:
     def __init__(self, config_file='/home/pi/streamer/config.json'):
         self.config_file = config_file
+
+        # Open the log file once, line-buffered, instead of
+        # makedirs+open on every log line
+        self._log_fh = None
+        try:
+            log_dir = "/home/pi/streamer/logs"
+            os.makedirs(log_dir, exist_ok=True)
+            self._log_fh = open(os.path.join(log_dir, "streamer.log"),
+                                'a', buffering=1)
+        except:
+            pass
+
         self.config = self.load_config()
+        self._ffmpeg_cmd_cache = None
         self.camera = None
         self.encoder = None
         self.output = None
         self.streaming = False
         self.start_time = None
-        
+
+        # Optional per-frame processor (LUT, overlay, watermark...).
+        # Must be a compiled (Numba/NumPy-vectorized) function that
+        # mutates the frame array in place - see dim_top_strip
+        self.frame_processor = None
+
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -33,36 +92,36 @@ class RTMPStreamer:
         self.log("Streamer initialized")
     
     def load_config(self):
-        """Load streaming configuration"""
-        default_config = {
-            "rtmp_url": "rtmp://a.rtmp.youtube.com/live2/",
-            "stream_key": "YOUR_STREAM_KEY_HERE",
-            "resolution": [1920, 1080],
-            "framerate": 30,
-            "bitrate": 2500000,
-            "gop_size": 60,
-            "preset": "medium",
-            "audio_enabled": False,
-            "audio_source": "hw:1,0"
-        }
-        
+        """Load and validate streaming configuration"""
+        config = Config()
+
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    loaded = json.load(f)
-                    default_config.update(loaded)
+                with open(self.config_file, 'rb') as f:
+                    # Missing fields fall back to the struct defaults;
+                    # wrong types are rejected here instead of
+                    # crashing FFmpeg later
+                    config = msgspec.json.decode(f.read(), type=Config)
         except Exception as e:
             self.log(f"Error loading config: {e}, using defaults")
-        
-        return default_config
+
+        return msgspec.to_builtins(config)
     
     def save_config(self, new_config):
         """Save configuration to file"""
         try:
-            self.config.update(new_config)
+            # Validate the merged config before touching self.config,
+            # so a rejected update can't leave bad values live
+            cfg = msgspec.convert({**self.config, **new_config}, Config)
+            self.config = msgspec.to_builtins(cfg)
+            self._ffmpeg_cmd_cache = None  # Rebuild on next start
             os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
+            # Write to a temp file and rename so a crash mid-write
+            # can't leave a corrupt config behind
+            tmp = self.config_file + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(msgspec.json.format(msgspec.json.encode(cfg), indent=2))
+            os.replace(tmp, self.config_file)
             self.log("Configuration saved")
             return True
         except Exception as e:
@@ -78,11 +137,8 @@ class RTMPStreamer:
         
         # Also write to log file
         try:
-            log_dir = "/home/pi/streamer/logs"
-            os.makedirs(log_dir, exist_ok=True)
-            log_file = os.path.join(log_dir, "streamer.log")
-            with open(log_file, 'a') as f:
-                f.write(log_msg + "\n")
+            if self._log_fh:
+                self._log_fh.write(log_msg + "\n")
         except:
             pass
     
@@ -96,14 +152,15 @@ class RTMPStreamer:
             video_config = self.camera.create_video_configuration(
                 main={
                     "size": tuple(self.config['resolution']),
-                    "format": "RGB888"
+                    "format": "YUV420"
                 },
                 controls={
                     "FrameRate": self.config['framerate']
                 }
             )
             self.camera.configure(video_config)
-            
+            self.camera.pre_callback = self.apply_frame_processor
+
             self.log(f"Camera configured: {self.config['resolution']}@{self.config['framerate']}fps")
             return True
             
@@ -111,56 +168,33 @@ class RTMPStreamer:
             self.log(f"Camera setup error: {e}")
             return False
     
+    def apply_frame_processor(self, request):
+        """Run the optional frame processor on the main stream"""
+        if self.frame_processor is None:
+            return
+        # MappedArray exposes the camera buffer as a numpy view -
+        # the processor mutates it in place, no copy is made
+        with MappedArray(request, "main") as m:
+            self.frame_processor(m.array)
+
     def build_ffmpeg_command(self):
-        """Build FFmpeg RTMP streaming command"""
+        """Build FFmpeg RTMP output command (mux only, no re-encode)"""
+        # Built once per config; save_config invalidates the cache
+        if self._ffmpeg_cmd_cache is not None:
+            return self._ffmpeg_cmd_cache
+
         rtmp_url = f"{self.config['rtmp_url']}{self.config['stream_key']}"
-        
-        # Base FFmpeg command for video
+
+        # Frames reach the hardware encoder over DMABUF inside
+        # picamera2, so FFmpeg never sees raw video - it only wraps
+        # the already-encoded H.264 into FLV for RTMP
         cmd = [
-            'ffmpeg',
-            '-f', 'rawvideo',
-            '-pix_fmt', 'rgb24',
-            '-s', f"{self.config['resolution'][0]}x{self.config['resolution'][1]}",
-            '-r', str(self.config['framerate']),
-            '-i', '-',  # Input from stdin
-        ]
-        
-        # Add audio if enabled
-        if self.config.get('audio_enabled', False):
-            cmd.extend([
-                '-f', 'alsa',
-                '-i', self.config.get('audio_source', 'hw:1,0'),
-                '-ac', '2',
-                '-ar', '44100',
-            ])
-        
-        # Video encoding settings
-        cmd.extend([
-            '-c:v', 'libx264',
-            '-preset', self.config.get('preset', 'medium'),
-            '-b:v', str(self.config['bitrate']),
-            '-maxrate', str(self.config['bitrate']),
-            '-bufsize', str(self.config['bitrate'] * 2),
-            '-pix_fmt', 'yuv420p',
-            '-g', str(self.config.get('gop_size', 60)),
-            '-keyint_min', str(self.config.get('gop_size', 60)),
-            '-sc_threshold', '0',
-        ])
-        
-        # Audio encoding if enabled
-        if self.config.get('audio_enabled', False):
-            cmd.extend([
-                '-c:a', 'aac',
-                '-b:a', '128k',
-            ])
-        
-        # RTMP output settings
-        cmd.extend([
             '-f', 'flv',
             '-flvflags', 'no_duration_filesize',
             rtmp_url
-        ])
-        
+        ]
+
+        self._ffmpeg_cmd_cache = cmd
         return cmd
     
     def start_stream(self):
@@ -176,20 +210,33 @@ class RTMPStreamer:
             
             # Build FFmpeg command
             ffmpeg_cmd = self.build_ffmpeg_command()
-            self.log(f"FFmpeg command: {' '.join(ffmpeg_cmd)}")
-            
-            # Create FFmpeg output
+            self.log(f"FFmpeg output: {' '.join(ffmpeg_cmd)}")
+
+            # Hardware encoder - picamera2 imports the camera buffers
+            # into the V4L2 M2M device directly (DMABUF), so no frame
+            # ever crosses a Python pipe
+            self.encoder = H264Encoder(
+                bitrate=self.config['bitrate'],
+                repeat=True,
+                iperiod=self.config.get('gop_size', 60)
+            )
+
+            # Create FFmpeg output (muxer only). FfmpegOutput
+            # captures audio through PulseAudio, so audio_source is
+            # a Pulse source name ('default', or a name from
+            # `pactl list sources short`), not an ALSA hw: device
             self.output = FfmpegOutput(
                 ' '.join(ffmpeg_cmd),
-                audio=self.config.get('audio_enabled', False)
+                audio=self.config.get('audio_enabled', False),
+                audio_device=self.config.get('audio_source', 'default')
             )
-            
+
             # Start camera and encoder
             self.camera.start()
             time.sleep(2)  # Let camera warm up
-            
-            self.camera.start_recording(self.output)
-            
+
+            self.camera.start_recording(self.encoder, self.output)
+
             self.streaming = True
             self.start_time = datetime.now()
             self.log("Stream started successfully")
@@ -232,25 +279,28 @@ class RTMPStreamer:
                 self.camera.stop()
                 self.camera.close()
                 self.camera = None
+            self.encoder = None
             self.output = None
         except Exception as e:
             self.log(f"Cleanup error: {e}")
     
     def write_status(self):
         """Write current status to file for dashboard"""
-        status = {
-            "streaming": self.streaming,
-            "start_time": self.start_time.isoformat() if self.start_time else None,
-            "uptime_seconds": (datetime.now() - self.start_time).total_seconds() if self.start_time else 0,
-            "resolution": self.config['resolution'],
-            "framerate": self.config['framerate'],
-            "bitrate": self.config['bitrate']
-        }
-        
+        status = Status(
+            streaming=self.streaming,
+            start_time=self.start_time.isoformat() if self.start_time else None,
+            resolution=self.config['resolution'],
+            framerate=self.config['framerate'],
+            bitrate=self.config['bitrate']
+        )
+
         try:
+            # Atomic write; no indent - only the dashboard reads this
             status_file = "/home/pi/streamer/status.json"
-            with open(status_file, 'w') as f:
-                json.dump(status, f, indent=2)
+            tmp = status_file + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(msgspec.json.encode(status))
+            os.replace(tmp, status_file)
         except Exception as e:
             self.log(f"Error writing status: {e}")
     
@@ -258,6 +308,9 @@ class RTMPStreamer:
         """Handle shutdown signals"""
         self.log(f"Received signal {signum}, shutting down...")
         self.stop_stream()
+        if self._log_fh:
+            self._log_fh.close()
+            self._log_fh = None
         sys.exit(0)
     
     def run(self):
@@ -269,11 +322,12 @@ class RTMPStreamer:
             self.log("Failed to start stream")
             return
         
-        # Keep running and update status
+        # Status is only written when state changes (start/stop) and
+        # the dashboard derives uptime from start_time, so there is
+        # nothing to refresh - just sleep until a shutdown signal
         try:
             while self.streaming:
-                self.write_status()
-                time.sleep(10)
+                signal.pause()
         except KeyboardInterrupt:
             self.log("Keyboard interrupt received")
         finally: